@@ -1,11 +1,14 @@
 import os
 import io
 import sys
-import tempfile
 import csv
 import re  # Import the regular expression module
+import threading
+import httplib2
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
@@ -20,6 +23,15 @@ SLIDE_TITLE = "Commercial Terms"
 MIME_TYPE_PPTX = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
 MIME_TYPE_FOLDER = 'application/vnd.google-apps.folder'
 
+# Folder listings and downloads are network-bound, so they run on a thread pool
+MAX_WORKERS = 8
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# Folders listed by a single files().list query ("'a' in parents or 'b' in parents ...")
+FOLDERS_PER_QUERY = 50
+# Retries (with exponential backoff) for a listing that fails with a 5xx, a 429 or a 403 rate limit
+LIST_NUM_RETRIES = 5
+HTTP_TIMEOUT = 60
+
 # List of all keys to extract
 KEYS_TO_FIND = [
     "Catchment Name :",
@@ -37,8 +49,8 @@ CSV_HEADERS = ["Source File Name"] + [key.replace(" :", "") for key in KEYS_TO_F
 
 # ---------------------
 
-def get_drive_service():
-    """Authenticates and returns the Google Drive API service object."""
+def get_drive_credentials():
+    """Loads (or obtains) the OAuth credentials used for the Google Drive API."""
     TOKEN_FILE = "token.json"
     creds = None
     if os.path.exists(TOKEN_FILE):
@@ -56,13 +68,30 @@ def get_drive_service():
                 sys.exit(1)
         with open(TOKEN_FILE, "w") as token:
             token.write(creds.to_json())
-    return build("drive", "v3", credentials=creds)
+    return creds
 
 
-def extract_field_value(full_text, key):
+def get_drive_service(creds=None):
+    """Authenticates and returns the Google Drive API service object."""
+    http = AuthorizedHttp(creds or get_drive_credentials(), http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    return build("drive", "v3", http=http, static_discovery=True)
+
+
+_thread_local = threading.local()
+
+
+def get_thread_drive_service(creds):
+    """Returns a Drive service owned by the calling thread (httplib2 is not thread-safe)."""
+    service = getattr(_thread_local, 'drive_service', None)
+    if service is None:
+        service = _thread_local.drive_service = get_drive_service(creds)
+    return service
+
+
+def build_field_pattern(key):
     """
-    Extracts the value following a specific key in a text block using regex
-    for more robust key matching and value extraction.
+    Builds the regex that extracts the value following a specific key, for more
+    robust key matching and value extraction.
     """
     # 1. Prepare key for regex: escape special characters, and remove trailing ':' if present
     # This key cleanup allows us to match keys like "Store Size" and "Store Size :"
@@ -73,8 +102,19 @@ def extract_field_value(full_text, key):
     # (.*?)         - Captures the value (non-greedy match)
     # (?:\n|\||$)   - Stops the capture at a newline (\n), a pipe (|), or the end of the string ($)
     pattern = rf"{key_clean}(?:\s*:?\s*)(.*?)(?:\n|\||$)"
+    return re.compile(pattern, re.IGNORECASE | re.DOTALL)
+
+
+# Compiled once here rather than rebuilt for every shape and table of every deck
+FIELD_PATTERNS = {key: build_field_pattern(key) for key in KEYS_TO_FIND}
 
-    match = re.search(pattern, full_text, re.IGNORECASE | re.DOTALL)
+
+def extract_field_value(full_text, key):
+    """
+    Extracts the value following a specific key in a text block.
+    """
+    pattern = FIELD_PATTERNS.get(key) or build_field_pattern(key)
+    match = pattern.search(full_text)
 
     if match:
         try:
@@ -92,7 +132,7 @@ def extract_field_value(full_text, key):
 
 def extract_data_from_ppt(file_path):
     """
-    Reads a local .pptx file, finds the slide with the matching title, and extracts
+    Reads a .pptx file (path or file-like object), finds the slide with the matching title, and extracts
     all key-value data points. Returns a dictionary of results.
     """
     results = {key: "" for key in KEYS_TO_FIND}
@@ -166,6 +206,10 @@ def extract_data_from_ppt(file_path):
                         results[key] = value
                         keys_found_count += 1
 
+        # Every key has a value, so the remaining shapes cannot change the result
+        if keys_found_count == len(KEYS_TO_FIND):
+            break
+
     # If any key is still empty, mark it as 'N/A'
     for key in KEYS_TO_FIND:
         if not results.get(key):
@@ -174,19 +218,21 @@ def extract_data_from_ppt(file_path):
     return results
 
 
-def find_and_process_files(drive_service, current_folder_id, csv_writer):
+def list_folder_contents(creds, folder_ids):
     """
-    Recursively finds all .pptx files and subfolders, processes files,
-    and writes the extracted data to the CSV file.
+    Lists the .pptx files and subfolders directly inside any of folder_ids with one
+    query, following pagination. Transient errors are retried; if the listing still
+    fails, a batch of folders is split in half and each half listed on its own, so a
+    failure only loses the folder that causes it rather than all of its siblings.
     """
-    # Query to list all files AND folders directly inside the current_folder_id
+    drive_service = get_thread_drive_service(creds)
+    parents_clause = " or ".join(f"'{folder_id}' in parents" for folder_id in folder_ids)
     query = (
-        f"'{current_folder_id}' in parents and trashed=false"
+        f"({parents_clause}) and trashed=false and "
+        f"(mimeType='{MIME_TYPE_PPTX}' or mimeType='{MIME_TYPE_FOLDER}')"
     )
-
+    items = []
     page_token = None
-    processed_count = 0
-
     while True:
         try:
             results = drive_service.files().list(
@@ -194,74 +240,106 @@ def find_and_process_files(drive_service, current_folder_id, csv_writer):
                 spaces='drive',
                 fields='nextPageToken, files(id, name, mimeType)',
                 pageToken=page_token
-            ).execute()
+            ).execute(num_retries=LIST_NUM_RETRIES)
         except Exception as e:
-            print(f"❌ Error listing contents of folder ID {current_folder_id}: {e}")
+            if len(folder_ids) > 1:
+                # Start over in halves; pages already listed for this batch are listed again there
+                middle = len(folder_ids) // 2
+                print(f"⚠️ Listing {len(folder_ids)} folders at once failed ({e}); retrying them in two halves...")
+                return (list_folder_contents(creds, folder_ids[:middle])
+                        + list_folder_contents(creds, folder_ids[middle:]))
+            print(f"❌ Error listing contents of folder ID {folder_ids[0]}: {e}")
             break  # Stop processing this branch
-
-        items = results.get('files', [])
-
-        for item in items:
-            item_id = item.get('id')
-            item_name = item.get('name')
-            item_mime = item.get('mimeType')
-
-            # --- 1. Process PPTX Files ---
-            if item_mime == MIME_TYPE_PPTX:
-                print(f"|-- 📄 Processing: {item_name}")
-
-                request = drive_service.files().get_media(fileId=item_id)
-                file_handle = io.BytesIO()
-                downloader = MediaIoBaseDownload(file_handle, request)
-
-                done = False
-                while not done:
-                    status, done = downloader.next_chunk()
-                file_handle.seek(0)
-
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.pptx') as temp_file:
-                    temp_file.write(file_handle.read())
-                    temp_path = temp_file.name
-
-                # Extract all structured data
-                extracted_data = extract_data_from_ppt(temp_path)
-                os.remove(temp_path)
-                processed_count += 1
-
-                # Prepare row for CSV
-                row_data = [item_name]
-                success = True
-
-                if 'error' in extracted_data:
-                    row_data.extend([extracted_data['error']] + [""] * (len(KEYS_TO_FIND) - 1))
-                    success = False
-                else:
-                    # Append all extracted values in the order defined by KEYS_TO_FIND
-                    for key in KEYS_TO_FIND:
-                        row_data.append(extracted_data[key])
-                        if extracted_data[key] == "N/A":
-                            success = False
-
-                # Write to CSV
-                csv_writer.writerow(row_data)
-
-                # Console feedback
-                status_char = "✅" if success else "⚠️"
-                print(f"|--   --> Status: {status_char} Catchment: {extracted_data.get(KEYS_TO_FIND[0], 'N/A')}")
-                if not success:
-                    print(f"|--   --> ERROR/MISSING DATA: {extracted_data.get('error', 'Some fields are N/A')}")
-
-
-            # --- 2. Recurse into Subfolders ---
-            elif item_mime == MIME_TYPE_FOLDER:
-                print(f"|-- 📁 Found Folder: {item_name}. Entering...")
-                # Recurse and accumulate the count
-                processed_count += find_and_process_files(drive_service, item_id, csv_writer)
-                print(f"|-- ⬆️ Exiting Folder: {item_name}")
-
+        items.extend(results.get('files', []))
         page_token = results.get('nextPageToken', None)
         if not page_token:
             break
+    return items
+
+
+def list_pptx_files(executor, creds, root_folder_id):
+    """
+    Walks the folder tree, listing the subfolders found by each listing as soon as it
+    comes back (up to FOLDERS_PER_QUERY per request) rather than waiting for the rest
+    of that level, so the crawl takes about one round-trip per level of depth.
+    Yields (id, name) pairs for every .pptx file as soon as its folder has been listed.
+    """
+    pending = {executor.submit(list_folder_contents, creds, [root_folder_id])}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            subfolder_ids = []
+            for item in future.result():
+                if item.get('mimeType') == MIME_TYPE_PPTX:
+                    yield item.get('id'), item.get('name')
+                elif item.get('mimeType') == MIME_TYPE_FOLDER:
+                    print(f"|-- 📁 Found Folder: {item.get('name')}")
+                    subfolder_ids.append(item.get('id'))
+            for start in range(0, len(subfolder_ids), FOLDERS_PER_QUERY):
+                pending.add(executor.submit(
+                    list_folder_contents, creds, subfolder_ids[start:start + FOLDERS_PER_QUERY]))
+
+
+def download_and_extract(creds, file_id):
+    """Downloads one .pptx from Drive and extracts its data without touching the disk."""
+    drive_service = get_thread_drive_service(creds)
+    try:
+        request = drive_service.files().get_media(fileId=file_id)
+        file_handle = io.BytesIO()
+        downloader = MediaIoBaseDownload(file_handle, request, chunksize=DOWNLOAD_CHUNK_SIZE)
+        done = False
+        while not done:
+            status, done = downloader.next_chunk()
+        file_handle.seek(0)
+    except Exception as e:
+        return {'error': f"[ERROR: Download failed: {e}]"}
+    return extract_data_from_ppt(file_handle)
+
+
+def find_and_process_files(creds, root_folder_id, csv_writer):
+    """
+    Finds all .pptx files below root_folder_id, downloads and processes them on a
+    thread pool, and writes the extracted data to the CSV file in the order the files are found.
+    """
+    processed_count = 0
+
+    # Separate pools so queued downloads never hold up listing the next folder level;
+    # each file starts downloading as soon as its folder has been listed.
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as list_executor, \
+            ThreadPoolExecutor(max_workers=MAX_WORKERS) as download_executor:
+        pending = [
+            (item_name, download_executor.submit(download_and_extract, creds, item_id))
+            for item_id, item_name in list_pptx_files(list_executor, creds, root_folder_id)
+        ]
+        print(f"|-- Found {len(pending)} PPTX files. Downloading and processing...")
+
+        for item_name, future in pending:
+            extracted_data = future.result()
+            print(f"|-- 📄 Processed: {item_name}")
+            processed_count += 1
+
+            # Prepare row for CSV
+            row_data = [item_name]
+            success = True
+
+            if 'error' in extracted_data:
+                row_data.extend([extracted_data['error']] + [""] * (len(KEYS_TO_FIND) - 1))
+                success = False
+            else:
+                # Append all extracted values in the order defined by KEYS_TO_FIND
+                for key in KEYS_TO_FIND:
+                    row_data.append(extracted_data[key])
+                    if extracted_data[key] == "N/A":
+                        success = False
+
+            # Write to CSV
+            csv_writer.writerow(row_data)
+
+            # Console feedback
+            status_char = "✅" if success else "⚠️"
+            print(f"|--   --> Status: {status_char} Catchment: {extracted_data.get(KEYS_TO_FIND[0], 'N/A')}")
+            if not success:
+                print(f"|--   --> ERROR/MISSING DATA: {extracted_data.get('error', 'Some fields are N/A')}")
 
     return processed_count
 
@@ -277,7 +355,7 @@ if __name__ == "__main__":
         f"\n--- Starting Recursive Scan in Folder ID: {PARENT_FOLDER_ID} (Looking for slide titled '{SLIDE_TITLE}') ---")
 
     try:
-        drive_service = get_drive_service()
+        creds = get_drive_credentials()
         total_processed_files = 0
 
         # Open file in 'w' mode (will overwrite) and set newline='' for proper CSV handling
@@ -291,7 +369,7 @@ if __name__ == "__main__":
             csv_writer.writerow(CSV_HEADERS)
 
             # Start the recursive search and processing
-            total_processed_files = find_and_process_files(drive_service, PARENT_FOLDER_ID, csv_writer)
+            total_processed_files = find_and_process_files(creds, PARENT_FOLDER_ID, csv_writer)
 
         # --- Final Report ---
         if total_processed_files > 0:
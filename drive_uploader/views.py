@@ -1,6 +1,5 @@
 import os
 import re
-import pickle
 import tempfile
 import base64
 from datetime import datetime, timedelta
@@ -11,68 +10,53 @@ import quopri
 import hashlib
 import time
 import random
+from functools import lru_cache
 from django.shortcuts import render
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
-from pptx import Presentation
+from uploader.google_credentials import DRIVE_GMAIL_CREDENTIALS
+from uploader.pptx_reader import PPTX_NAMESPACES, open_pptx_zip, paragraph_text, read_first_slide_xml
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-CREDENTIALS_FILE = os.path.join(BASE_DIR, 'bdstorage_credentials.json')
-TOKEN_FILE_PATH = os.path.join(BASE_DIR, 'token.pickle')
 HASH_DB_FILE = os.path.join(BASE_DIR, 'uploaded_ppt_hashes.json')
 
-SCOPES = [
-    'https://www.googleapis.com/auth/drive',
-    'https://www.googleapis.com/auth/gmail.readonly'
-]
+# Files up to this size go up in a single multipart request; larger ones use a resumable session.
+RESUMABLE_UPLOAD_THRESHOLD = 16 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# Messages fetched per Gmail batch request (Gmail rate-limits batches larger than 50)
+GMAIL_BATCH_SIZE = 50
 
 DRIVE_ID_BYTE_PATTERN = re.compile(b'/d/([a-zA-Z0-9_-]+)')
-
+ZONE_PATTERN = re.compile(r"ZONE\s*:\s*(.*?)(?:\s*STATE|\s*CITY|\s*PIN CODE|$)", re.IGNORECASE | re.DOTALL)
+IMAGE_TAG_PATTERN = re.compile(r'\s*\[Image \d+\]\s*')
+PPTX_NAME_PATTERN = re.compile(r'([a-zA-Z0-9_ -]+\.pptx)', re.IGNORECASE)
+# Version/copy suffixes such as " (1)", " _2", " - copy" or " v3"
+COPY_SUFFIX_PATTERN = re.compile(r'(\s*\(\d+\)|\s+_\d+|\s+-\s*copy|\s+copy|\s+\d+|\s+v\d+)$', re.IGNORECASE)
+UNSAFE_FILENAME_CHARS_PATTERN = re.compile(r'[^\w\-_\. ()]')
+
+
+@lru_cache(maxsize=256)
+def _market_pattern(zone_name):
+    """Market names either start with the zone name, a digit and two underscores, or with 'BD-' / 'Add_'."""
+    return re.compile(
+        r"(?:^" + re.escape(zone_name) + r"\s*\d_.*?_.*$|^BD-.*$|^Add_.*$)",
+        re.IGNORECASE | re.MULTILINE
+    )
 
 
 def authenticate_google_services():
-    """Authenticates for both Drive and Gmail APIs using a single flow."""
-    creds = None
-    if os.path.exists(TOKEN_FILE_PATH):
-        try:
-            with open(TOKEN_FILE_PATH, 'rb') as token:
-                creds = pickle.load(token)
-        except Exception:
-            creds = None
-
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            if not os.path.exists(CREDENTIALS_FILE):
-                raise FileNotFoundError(
-                    f"Credentials file not found at {CREDENTIALS_FILE}. Please ensure it's there.")
-            try:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    CREDENTIALS_FILE, SCOPES)
-                creds = flow.run_local_server(port=0)
-            except Exception as e:
-                print(f"Error during OAuth flow: {e}")
-                return None, None
-        try:
-            with open(TOKEN_FILE_PATH, 'wb') as token:
-                pickle.dump(creds, token)
-        except Exception as e:
-            print(f"Failed to save API token: {e}")
-
-    try:
-        drive_service = build('drive', 'v3', credentials=creds)
-        gmail_service = build('gmail', 'v1', credentials=creds)
-        return drive_service, gmail_service
-    except Exception as e:
-        print(f"Error building API services: {e}")
+    """
+    Authenticates for both Drive and Gmail APIs using a single flow. Returns the
+    calling thread's (drive_service, gmail_service), or (None, None) if that failed.
+    """
+    drive_service = DRIVE_GMAIL_CREDENTIALS.get_service('drive', 'v3')
+    gmail_service = DRIVE_GMAIL_CREDENTIALS.get_service('gmail', 'v1') if drive_service else None
+    if not gmail_service:
         return None, None
+    return drive_service, gmail_service
 
 
 def api_call_with_backoff(api_func, **kwargs):
@@ -106,9 +90,8 @@ def api_call_with_backoff(api_func, **kwargs):
 
 def normalize_filename(filename):
     """Strips common version/copy suffixes. Kept for link parsing."""
-    PATTERN = r'(\s*\(\d+\)|\s+_\d+|\s+-\s*copy|\s+copy|\s+\d+|\s+v\d+)$'
     base_name, ext = os.path.splitext(filename)
-    cleaned_name = re.sub(PATTERN, '', base_name, flags=re.IGNORECASE).strip()
+    cleaned_name = COPY_SUFFIX_PATTERN.sub('', base_name).strip()
     return cleaned_name + ext
 
 
@@ -171,6 +154,32 @@ def get_messages_with_ppt(service, user_id='me'):
         return []
 
 
+def get_messages_batch(service, msg_ids, user_id='me'):
+    """
+    Fetches the full messages for msg_ids with batch requests of GMAIL_BATCH_SIZE.
+    Returns {msg_id: message}; messages whose fetch failed are left out, and
+    download_attachment then fetches them on its own (with backoff).
+    """
+    fetched = {}
+
+    def store_message(request_id, response, exception):
+        if exception is None:
+            fetched[request_id] = response
+        else:
+            print(f"Batched fetch of message {request_id} failed: {exception}")
+
+    for start in range(0, len(msg_ids), GMAIL_BATCH_SIZE):
+        try:
+            batch = service.new_batch_http_request(callback=store_message)
+            for msg_id in msg_ids[start:start + GMAIL_BATCH_SIZE]:
+                batch.add(service.users().messages().get(userId=user_id, id=msg_id, format='full'),
+                          request_id=msg_id)
+            batch.execute()
+        except Exception as e:
+            print(f"An error occurred during the batched message fetch: {e}")
+    return fetched
+
+
 def get_attachment_parts_recursively(parts):
     """Recursively searches all parts of a Gmail message for any physical attachment."""
     all_file_parts = []
@@ -187,7 +196,9 @@ def get_attachment_parts_recursively(parts):
 
 def find_all_drive_links(message_payload):
     """Aggressively searches the entire message payload for ALL unique Drive file IDs."""
-    found_links = []
+    # Keyed on (file_id, filename); dicts keep insertion order, so the result
+    # order matches the old list while membership checks stay O(1).
+    found_links = {}
 
     def recursive_link_search(parts):
         if not parts: return
@@ -212,7 +223,7 @@ def find_all_drive_links(message_payload):
 
                         try:
                             decoded_data = decoded_bytes.decode('utf-8', errors='ignore')
-                            filename_match = re.search(r'([a-zA-Z0-9_ -]+\.pptx)', decoded_data, re.IGNORECASE)
+                            filename_match = PPTX_NAME_PATTERN.search(decoded_data)
                             if filename_match:
                                 raw_name = filename_match.group(1).strip()
                                 normalized_raw_name = normalize_filename(raw_name).replace(".pptx", "")
@@ -222,7 +233,7 @@ def find_all_drive_links(message_payload):
 
                         link_tuple = (file_id, filename)
                         if link_tuple not in found_links:
-                            found_links.append(link_tuple)
+                            found_links[link_tuple] = None
                             print(f"✅ FINAL BYTE-LEVEL FOUND: ID={file_id}, Unique Filename={filename}")
 
                 except Exception as e:
@@ -232,7 +243,7 @@ def find_all_drive_links(message_payload):
                 recursive_link_search(part['parts'])
 
     recursive_link_search(message_payload.get('parts', []))
-    return found_links
+    return list(found_links)
 
 
 def download_file_from_drive(drive_service, file_id, file_name, temp_dir_base):
@@ -241,7 +252,7 @@ def download_file_from_drive(drive_service, file_id, file_name, temp_dir_base):
     if not clean_file_name.lower().endswith('.pptx'):
         clean_file_name = os.path.splitext(clean_file_name)[0].strip() + '.pptx'
 
-    safe_file_name = re.sub(r'[^\w\-_\. ()]', '_', clean_file_name)
+    safe_file_name = UNSAFE_FILENAME_CHARS_PATTERN.sub('_', clean_file_name)
     file_path = os.path.join(temp_dir_base, safe_file_name)
 
     try:
@@ -274,13 +285,13 @@ def download_file_from_drive(drive_service, file_id, file_name, temp_dir_base):
         return None
 
 
-def download_attachment(drive_service, gmail_service, msg_id, user_id='me'):
+def download_attachment(drive_service, gmail_service, msg_id, user_id='me', message=None):
     """
     Downloads ALL physical attachments AND ALL linked Drive files from one email.
-    Uses backoff for message and attachment get calls.
+    Uses backoff for message and attachment get calls. Pass message when it has
+    already been fetched (see get_messages_batch) to skip the message get.
     """
     downloaded_files = []
-    message = None
     temp_dir_base = None
     attachment_ids_processed = set()
 
@@ -288,10 +299,11 @@ def download_attachment(drive_service, gmail_service, msg_id, user_id='me'):
         temp_dir_base = tempfile.mkdtemp()
 
         # Use backoff for the message.get API call
-        message = api_call_with_backoff(
-            gmail_service.users().messages().get,
-            userId=user_id, id=msg_id, format='full'
-        )
+        if message is None:
+            message = api_call_with_backoff(
+                gmail_service.users().messages().get,
+                userId=user_id, id=msg_id, format='full'
+            )
 
         payload = message.get('payload')
         if not payload:
@@ -377,40 +389,28 @@ def get_market_and_zone_name_from_ppt(ppt_path):
     zone_name = None
     slide_text = ""
     try:
-        prs = Presentation(ppt_path)
-        if not prs.slides:
+        # Only the first slide is needed, so read its XML part instead of loading the whole deck
+        with open_pptx_zip(ppt_path) as pptx_zip:
+            first_slide = read_first_slide_xml(pptx_zip)
+        if first_slide is None:
             print("PPT has no slides.")
             return None, None
-        first_slide = prs.slides[0]
-
-        for shape in first_slide.shapes:
-            if hasattr(shape, "text_frame") and shape.text_frame:
-                for paragraph in shape.text_frame.paragraphs:
-                    slide_text += paragraph.text + "\n"
+        paragraphs = first_slide.xpath('p:cSld/p:spTree/p:sp/p:txBody/a:p', namespaces=PPTX_NAMESPACES)
+        slide_text = "\n".join(paragraph_text(paragraph) for paragraph in paragraphs)
 
-        zone_match = re.search(
-            r"ZONE\s*:\s*(.*?)(?:\s*STATE|\s*CITY|\s*PIN CODE|$)",
-            slide_text,
-            re.IGNORECASE | re.DOTALL
-        )
+        zone_match = ZONE_PATTERN.search(slide_text)
         if zone_match:
             zone_name = zone_match.group(1).strip()
-            zone_name = re.sub(r'\s*\[Image \d+\]\s*', '', zone_name).strip()
+            zone_name = IMAGE_TAG_PATTERN.sub('', zone_name).strip()
         else:
             print("EXTRACTION FAIL: Could not find 'ZONE : ' pattern on the first slide.")
             return None, None
 
         if zone_name:
-            market_pattern_combined = r"(?:^" + re.escape(zone_name) + r"\s*\d_.*?_.*$|^BD-.*$|^Add_.*$)"
-
-            market_match = re.search(
-                market_pattern_combined,
-                slide_text,
-                re.IGNORECASE | re.MULTILINE
-            )
+            market_match = _market_pattern(zone_name).search(slide_text)
             if market_match:
                 market_name = market_match.group(0).strip()
-                market_name = re.sub(r'\s*\[Image \d+\]\s*', '', market_name).strip()
+                market_name = IMAGE_TAG_PATTERN.sub('', market_name).strip()
             else:
                 print(f"EXTRACTION FAIL: Found ZONE: '{zone_name}', but MARKET name did not match expected patterns.")
 
@@ -500,7 +500,8 @@ def strict_replace_file_in_drive(service, file_path, desired_filename, parent_fo
         'name': final_drive_name,
         'parents': [parent_folder_id]
     }
-    media = MediaFileUpload(file_path, resumable=True)
+    resumable = os.path.getsize(file_path) > RESUMABLE_UPLOAD_THRESHOLD
+    media = MediaFileUpload(file_path, resumable=resumable, chunksize=UPLOAD_CHUNK_SIZE)
 
     try:
         uploaded_file = service.files().create(
@@ -598,11 +599,13 @@ def check_email_and_upload(request):
 
     all_results = []
     dirs_to_cleanup = set()
+    full_messages = get_messages_batch(gmail_service, [message['id'] for message in messages])
 
     for message in messages:
         msg_id = message['id']
 
-        downloaded_files, full_message_payload = download_attachment(drive_service, gmail_service, msg_id)
+        downloaded_files, full_message_payload = download_attachment(drive_service, gmail_service, msg_id,
+                                                                     message=full_messages.pop(msg_id, None))
 
         if downloaded_files:
             temp_dir_to_clean = downloaded_files[0]['temp_dir']
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os.path
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -78,6 +79,45 @@ CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+# Video tasks run for minutes; a worker reserves only the task it is about to run
+# so queued decks go to whichever worker frees up first.
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Look up the Zone and Market folders for an uploaded PPT in a single Drive batch request.
+DRIVE_BATCH_FOLDER_LOOKUP = True
+# Number of files uploader.views.upload_many sends to Drive at once.
+DRIVE_UPLOAD_MAX_WORKERS = 2
+
+# Queued WEBM->MP4 conversions: uploads and results live here (must be shared with the
+# Celery workers) and are deleted after the retention period.
+VIDEO_CONVERSION_JOBS_DIR = os.path.join(BASE_DIR, 'conversion_jobs')
+VIDEO_CONVERSION_RETENTION_SECONDS = 60 * 60
+# Set to an nginx 'internal' location aliased to VIDEO_CONVERSION_JOBS_DIR to serve results via X-Accel-Redirect.
+VIDEO_CONVERSION_ACCEL_REDIRECT_PREFIX = None
+# Uploads larger than FILE_UPLOAD_MAX_MEMORY_SIZE are spooled here, on disk: they are
+# written in full before any view can check their size against the free tmpfs space.
+FILE_UPLOAD_TEMP_DIR = tempfile.gettempdir()
+# How long a fully processed deck is remembered; resubmitting the folder with the same,
+# unmodified PPTX within this window is skipped. 0 disables it.
+VIDEO_PROCESSOR_RESULT_CACHE_SECONDS = 60 * 60
+
+# Shared by the web process and the Celery workers (task locks and results above)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': 'redis://localhost:6379/1',
+    }
+}
+
+# Video-processing progress is logged at INFO; let it through, since a Celery worker
+# otherwise only shows WARNING and above and the page points users at the worker's console.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'loggers': {
+        'video_processor': {'level': 'INFO'},
+    },
+}
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
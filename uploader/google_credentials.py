@@ -0,0 +1,131 @@
+"""OAuth credentials and per-thread Google API services, shared by the apps."""
+import json
+import os
+import threading
+from functools import lru_cache
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CREDENTIALS_FILE = os.path.join(BASE_DIR, 'bdstorage_credentials.json')
+# Pickled token written by earlier versions; convert it with 'manage.py migrate_drive_token'.
+LEGACY_TOKEN_PICKLE_PATH = os.path.join(BASE_DIR, 'token.pickle')
+# Socket timeout for API connections; httplib2 waits forever by default
+HTTP_TIMEOUT = 60
+
+DRIVE_SCOPES = ['https://www.googleapis.com/auth/drive']
+DRIVE_GMAIL_SCOPES = DRIVE_SCOPES + ['https://www.googleapis.com/auth/gmail.readonly']
+
+
+@lru_cache(maxsize=None)
+def get_discovery_doc(api_name, api_version):
+    """The discovery document bundled with the client library, parsed once per process."""
+    return json.loads(get_static_doc(api_name, api_version))
+
+
+class CredentialStore:
+    """
+    OAuth credentials for one token file, loaded once per process and shared by every
+    thread; the lock keeps two threads from refreshing or re-running the OAuth flow at
+    once. Each thread builds its API services on them once (httplib2 connections are
+    not thread-safe) and reuses them afterwards.
+    """
+
+    def __init__(self, token_path, scopes):
+        self.token_path = token_path
+        self.scopes = scopes
+        self._creds = None
+        self._lock = threading.Lock()
+        self._services = threading.local()
+
+    def _load(self):
+        if not os.path.exists(self.token_path):
+            return None
+        try:
+            return Credentials.from_authorized_user_file(self.token_path, self.scopes)
+        except Exception as e:
+            print(f"Could not load API token {self.token_path}: {e}. Will re-authenticate.")
+            return None
+
+    def _save(self, creds):
+        try:
+            with open(self.token_path, 'w') as token:
+                token.write(creds.to_json())
+            print(f"API credentials saved to {self.token_path}.")
+        except Exception as e:
+            print(f"Failed to save API token {self.token_path}: {e}")
+
+    def get_credentials(self):
+        """
+        Returns the process-wide credentials, reading the token file only the first time
+        and refreshing the same object in place once it has expired; None if there are none.
+        """
+        with self._lock:
+            creds = self._creds if self._creds is not None else self._load()
+            if creds is None and not os.path.exists(self.token_path) and os.path.exists(LEGACY_TOKEN_PICKLE_PATH):
+                # The old token is still good; don't make the user sign in again from a request or a worker
+                print(f"Found legacy pickled token at {LEGACY_TOKEN_PICKLE_PATH}; "
+                      "run 'python manage.py migrate_drive_token' to convert it.")
+                return None
+            if creds and creds.valid:
+                self._creds = creds
+                return creds
+
+            if creds and creds.expired and creds.refresh_token:
+                print(f"API credentials from {self.token_path} expired, refreshing...")
+                try:
+                    creds.refresh(Request())
+                except Exception as e:
+                    print(f"Error refreshing API token: {e}. Re-authenticating...")
+                    creds = None
+            else:
+                creds = None
+            if creds is None:
+                print(f"Initiating new API authentication flow using {CREDENTIALS_FILE}...")
+                if not os.path.exists(CREDENTIALS_FILE):
+                    print(f"Credentials file not found at {CREDENTIALS_FILE}. Please ensure it's there.")
+                    return None
+                try:
+                    flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, self.scopes)
+                    creds = flow.run_local_server(port=0)
+                except Exception as e:
+                    print(f"Error during OAuth flow: {e}")
+                    return None
+            self._save(creds)
+            self._creds = creds
+            return creds
+
+    def get_service(self, api_name, api_version):
+        """
+        Returns the calling thread's service for the API, or None if there are no
+        credentials. Services pick up in-place refreshes, so a thread only builds new ones
+        when the credentials object itself was replaced by a new OAuth flow.
+        """
+        creds = self.get_credentials()
+        if not creds:
+            return None
+        if getattr(self._services, 'creds', None) is not creds:
+            self._services.creds = creds
+            self._services.by_api = {}
+        key = (api_name, api_version)
+        if key not in self._services.by_api:
+            try:
+                # A keep-alive connection of the thread's own, with a timeout so a stalled
+                # request can't hang a worker
+                http = AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+                self._services.by_api[key] = build_from_document(get_discovery_doc(api_name, api_version), http=http)
+            except Exception as e:
+                print(f"Error building {api_name} {api_version} service: {e}")
+                return None
+        return self._services.by_api[key]
+
+
+# Drive-only token, used by the uploader and the video processor
+DRIVE_CREDENTIALS = CredentialStore(os.path.join(BASE_DIR, 'drive_token.json'), DRIVE_SCOPES)
+# Drive + Gmail token for drive_uploader, kept apart from the Drive-only one
+DRIVE_GMAIL_CREDENTIALS = CredentialStore(os.path.join(BASE_DIR, 'drive_gmail_token.json'), DRIVE_GMAIL_SCOPES)
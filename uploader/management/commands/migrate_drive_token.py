@@ -0,0 +1,34 @@
+import os
+import pickle
+from django.core.management.base import BaseCommand, CommandError
+from uploader.google_credentials import DRIVE_CREDENTIALS, DRIVE_GMAIL_CREDENTIALS, LEGACY_TOKEN_PICKLE_PATH
+
+
+class Command(BaseCommand):
+    help = ("Converts the legacy pickled token (token.pickle) into the JSON tokens the apps read: "
+            "drive_token.json, and drive_gmail_token.json if the token also grants Gmail access.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Overwrite existing JSON tokens.")
+
+    def handle(self, *args, **options):
+        if not os.path.exists(LEGACY_TOKEN_PICKLE_PATH):
+            raise CommandError(f"No legacy token found at {LEGACY_TOKEN_PICKLE_PATH}.")
+        stores = [store for store in (DRIVE_CREDENTIALS, DRIVE_GMAIL_CREDENTIALS)
+                  if options['force'] or not os.path.exists(store.token_path)]
+        if not stores:
+            raise CommandError(f"{DRIVE_CREDENTIALS.token_path} and {DRIVE_GMAIL_CREDENTIALS.token_path} "
+                               "already exist. Use --force to overwrite them.")
+
+        # Only ever run this on a token file this app wrote itself: unpickling executes code.
+        with open(LEGACY_TOKEN_PICKLE_PATH, 'rb') as token:
+            creds = pickle.load(token)
+        for store in stores:
+            if not creds.has_scopes(store.scopes):
+                self.stdout.write(self.style.WARNING(
+                    f"The legacy token lacks scopes {store.scopes}; not writing {store.token_path}."))
+                continue
+            with open(store.token_path, 'w') as token:
+                token.write(creds.to_json())
+            self.stdout.write(self.style.SUCCESS(
+                f"Migrated API credentials from {LEGACY_TOKEN_PICKLE_PATH} to {store.token_path}."))
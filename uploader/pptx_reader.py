@@ -0,0 +1,63 @@
+"""Reading .pptx files straight from their zip archive, shared by the uploader apps."""
+import mmap
+import os
+import posixpath
+import zipfile
+from contextlib import contextmanager
+from lxml import etree
+
+# Namespaces used when reading slide XML straight out of the .pptx archive
+PPTX_NAMESPACES = {
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'p': 'http://schemas.openxmlformats.org/presentationml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+}
+XML_PARSER = etree.XMLParser(resolve_entities=False)
+_BREAK_TAG = f"{{{PPTX_NAMESPACES['a']}}}br"
+_TEXT_TAG = f"{{{PPTX_NAMESPACES['a']}}}t"
+
+
+class _MappedFile(mmap.mmap):
+    """Read-only memory map zipfile can read from directly (mmap only has seekable() from Python 3.13)."""
+
+    def seekable(self):
+        return True
+
+
+@contextmanager
+def open_pptx_zip(ppt_path):
+    """
+    Opens a .pptx as a ZipFile. Paths are memory-mapped, so only the pages of the parts
+    actually read are faulted in; file objects are used as they are.
+    """
+    if not isinstance(ppt_path, (str, os.PathLike)):
+        with zipfile.ZipFile(ppt_path) as pptx_zip:
+            yield pptx_zip
+        return
+    with open(ppt_path, 'rb') as fh, _MappedFile(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with zipfile.ZipFile(mapped) as pptx_zip:
+            yield pptx_zip
+
+
+def read_first_slide_xml(pptx_zip):
+    """Returns the parsed XML of the first slide (in presentation order), or None if there are no slides."""
+    presentation = etree.fromstring(pptx_zip.read('ppt/presentation.xml'), XML_PARSER)
+    first_slide_rid = presentation.xpath('string(p:sldIdLst/p:sldId[1]/@r:id)', namespaces=PPTX_NAMESPACES)
+    if not first_slide_rid:
+        return None
+    rels = etree.fromstring(pptx_zip.read('ppt/_rels/presentation.xml.rels'), XML_PARSER)
+    target = rels.xpath(f'string(rel:Relationship[@Id="{first_slide_rid}"]/@Target)', namespaces=PPTX_NAMESPACES)
+    slide_part = posixpath.normpath(posixpath.join('ppt', target)).lstrip('/')
+    return etree.fromstring(pptx_zip.read(slide_part), XML_PARSER)
+
+
+def paragraph_text(paragraph):
+    """Same text python-pptx reports for a paragraph: runs and fields, with line breaks as vertical tabs."""
+    parts = []
+    for child in paragraph:
+        if child.tag == _BREAK_TAG:
+            parts.append('\v')
+        else:
+            parts.extend(t.text or '' for t in child.iterchildren(_TEXT_TAG))
+    return ''.join(parts)
@@ -1,102 +1,79 @@
 import os
 import re
-import pickle
-import tempfile
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from cachetools import TTLCache
+from django.conf import settings
 from django.shortcuts import render
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload
-from pptx import Presentation
+from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
+from .google_credentials import DRIVE_CREDENTIALS
+from .pptx_reader import PPTX_NAMESPACES, open_pptx_zip, paragraph_text, read_first_slide_xml
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-CREDENTIALS_FILE = os.path.join(BASE_DIR, 'bdstorage_credentials.json')
-TOKEN_FILE_PATH = os.path.join(BASE_DIR, 'token.pickle')
 
+# Files up to this size go up in a single request; larger ones use a resumable session.
+RESUMABLE_UPLOAD_THRESHOLD = 16 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# Rate-limited or failed uploads are retried with exponential backoff
+UPLOAD_MAX_RETRIES = 5
+MAX_BACKOFF_SECONDS = 64
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+PPTX_MIME_TYPE = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
 
-def authenticate_google_drive():
-    SCOPES = ['https://www.googleapis.com/auth/drive']
-    creds = None
-    if os.path.exists(TOKEN_FILE_PATH):
-        try:
-            with open(TOKEN_FILE_PATH, 'rb') as token:
-                creds = pickle.load(token)
-            print("Loaded Drive API credentials from token file.")
-        except Exception as e:
-            print(f"Could not load Drive API token: {e}. Will re-authenticate.")
-            creds = None
+ZONE_PATTERN = re.compile(r"ZONE\s*:\s*(.*?)(?:\s*STATE|\s*CITY|\s*PIN CODE|$)", re.IGNORECASE | re.DOTALL)
+IMAGE_TAG_PATTERN = re.compile(r'\s*\[Image \d+\]\s*')
 
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            print("Drive API credentials expired, refreshing...")
-            creds.refresh(Request())
-        else:
-            print(f"Initiating new Drive API authentication flow using {CREDENTIALS_FILE}...")
-            if not os.path.exists(CREDENTIALS_FILE):
-                raise FileNotFoundError(
-                    f"Drive credentials file not found at {CREDENTIALS_FILE}. Please ensure it's there.")
-            try:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    CREDENTIALS_FILE, SCOPES)
-                creds = flow.run_local_server(port=0)
-            except Exception as e:
-                print(f"Error during OAuth flow: {e}")
-                return None
-        try:
-            with open(TOKEN_FILE_PATH, 'wb') as token:
-                pickle.dump(creds, token)
-            print(f"Drive API credentials saved to {TOKEN_FILE_PATH}.")
-        except Exception as e:
-            print(f"Failed to save Drive API token: {e}")
 
-    try:
-        return build('drive', 'v3', credentials=creds)
-    except Exception as e:
-        print(f"Error building Drive service: {e}")
-        return None
+@lru_cache(maxsize=256)
+def _market_pattern(zone_name):
+    """Market names either start with the zone name, a digit and two underscores, or with 'BD-' / 'Add_'."""
+    return re.compile(
+        r"(?:^" + re.escape(zone_name) + r"\s*\d_.*?_.*$|^BD-.*$|^Add_.*$)",
+        re.IGNORECASE | re.MULTILINE
+    )
+
+# Folder IDs by (parent folder ID, folder name), so repeated uploads to the same
+# Zone/Market skip the Drive lookups. Entries expire in case folders are moved or deleted.
+_FOLDER_CACHE = TTLCache(maxsize=4096, ttl=3600)
+_FOLDER_CACHE_LOCK = threading.Lock()
+
+
+def authenticate_google_drive():
+    """Returns the calling thread's Drive service, or None if there are no credentials."""
+    return DRIVE_CREDENTIALS.get_service('drive', 'v3')
 
 
 def get_market_and_zone_name_from_ppt(ppt_path):
     market_name = None
     zone_name = None
     try:
-        prs = Presentation(ppt_path)
-        if not prs.slides:
+        # Only the first slide is needed, so read its XML part instead of loading the whole deck
+        with open_pptx_zip(ppt_path) as pptx_zip:
+            first_slide = read_first_slide_xml(pptx_zip)
+        if first_slide is None:
             print("PPT has no slides.")
             return None, None
-        first_slide = prs.slides[0]
-        slide_text = ""
-        for shape in first_slide.shapes:
-            if hasattr(shape, "text_frame") and shape.text_frame:
-                for paragraph in shape.text_frame.paragraphs:
-                    slide_text += paragraph.text + "\n"
-        zone_match = re.search(
-            r"ZONE\s*:\s*(.*?)(?:\s*STATE|\s*CITY|\s*PIN CODE|$)",
-            slide_text,
-            re.IGNORECASE | re.DOTALL
-        )
+        paragraphs = first_slide.xpath('p:cSld/p:spTree/p:sp/p:txBody/a:p', namespaces=PPTX_NAMESPACES)
+        slide_text = "\n".join(paragraph_text(paragraph) for paragraph in paragraphs)
+        zone_match = ZONE_PATTERN.search(slide_text)
         if zone_match:
             zone_name = zone_match.group(1).strip()
-            zone_name = re.sub(r'\s*\[Image \d+\]\s*', '', zone_name).strip()
+            zone_name = IMAGE_TAG_PATTERN.sub('', zone_name).strip()
         else:
             print("Could not find 'ZONE : ' on the first slide.")
             return None, None
         if zone_name:
-            # New combined pattern to capture both types of market names
-            market_pattern_combined = r"(?:^" + re.escape(zone_name) + r"\s*\d_.*?_.*$|^BD-.*$|^Add_.*$)"
-
-            market_match = re.search(
-                market_pattern_combined,
-                slide_text,
-                re.IGNORECASE | re.MULTILINE
-            )
+            market_match = _market_pattern(zone_name).search(slide_text)
             if market_match:
                 market_name = market_match.group(0).strip()
-                market_name = re.sub(r'\s*\[Image \d+\]\s*', '', market_name).strip()
+                market_name = IMAGE_TAG_PATTERN.sub('', market_name).strip()
                 print(f"DEBUG: Found new market name: {market_name}")
             else:
                 print(
@@ -109,6 +86,18 @@ def get_market_and_zone_name_from_ppt(ppt_path):
         return None, None
 
 
+def _get_cached_folder_id(folder_name, parent_folder_id):
+    with _FOLDER_CACHE_LOCK:
+        return _FOLDER_CACHE.get((parent_folder_id, folder_name))
+
+
+def _cache_folder_id(folder_name, parent_folder_id, folder_id):
+    if folder_id:
+        with _FOLDER_CACHE_LOCK:
+            _FOLDER_CACHE[(parent_folder_id, folder_name)] = folder_id
+    return folder_id
+
+
 def create_drive_folder(service, folder_name, parent_folder_id):
     file_metadata = {
         'name': folder_name,
@@ -118,7 +107,7 @@ def create_drive_folder(service, folder_name, parent_folder_id):
     try:
         file = service.files().create(body=file_metadata, fields='id').execute()
         print(f"Folder '{folder_name}' created with ID: {file.get('id')}")
-        return file.get('id')
+        return _cache_folder_id(folder_name, parent_folder_id, file.get('id'))
     except HttpError as error:
         print(f"An HTTP error occurred during folder creation: {error}")
         return None
@@ -128,6 +117,10 @@ def create_drive_folder(service, folder_name, parent_folder_id):
 
 
 def find_or_create_folder(service, folder_name, parent_folder_id):
+    cached_folder_id = _get_cached_folder_id(folder_name, parent_folder_id)
+    if cached_folder_id:
+        print(f"Using cached folder '{folder_name}' with ID: {cached_folder_id}")
+        return cached_folder_id
     try:
         query = (
             f"name = '{folder_name}' and "
@@ -143,7 +136,7 @@ def find_or_create_folder(service, folder_name, parent_folder_id):
         items = results.get('files', [])
         if items:
             print(f"Found existing folder '{folder_name}' with ID: {items[0]['id']}")
-            return items[0]['id']
+            return _cache_folder_id(folder_name, parent_folder_id, items[0]['id'])
         else:
             print(f"Folder '{folder_name}' not found, creating it...")
             return create_drive_folder(service, folder_name, parent_folder_id)
@@ -155,17 +148,117 @@ def find_or_create_folder(service, folder_name, parent_folder_id):
         return None
 
 
-def upload_file_to_drive(service, file_path, parent_folder_id):
+def batch_find_zone_and_market_folders(service, zone_name, market_name, parent_folder_id):
+    """
+    Looks up the zone folder and all folders named after the market in one batch
+    request, since the market lookup would otherwise have to wait for the zone ID.
+    Returns {'zone': zone_folder_id or None, 'market_candidates': [...] or None}, or
+    None if the batch failed and the caller should fall back to individual lookups.
+    The market lookup can't be scoped to a parent yet, so it lists same-named folders
+    across the whole Drive; when that takes more than one page, market_candidates is
+    None and the caller looks the market up under the resolved zone instead.
+    """
+    responses = {}
+
+    def store_response(request_id, response, exception):
+        if exception is None:
+            responses[request_id] = response
+        else:
+            print(f"Batched folder lookup '{request_id}' failed: {exception}")
+
+    zone_query = (
+        f"name = '{zone_name}' and "
+        f"mimeType = 'application/vnd.google-apps.folder' and "
+        f"'{parent_folder_id}' in parents and "
+        "trashed = false"
+    )
+    market_query = (
+        f"name = '{market_name}' and "
+        f"mimeType = 'application/vnd.google-apps.folder' and "
+        "trashed = false"
+    )
+    try:
+        batch = service.new_batch_http_request(callback=store_response)
+        batch.add(service.files().list(q=zone_query, spaces='drive', fields='files(id, name)'),
+                  request_id='zone')
+        batch.add(service.files().list(q=market_query, spaces='drive', pageSize=1000,
+                                       fields='nextPageToken, files(id, name, parents)'),
+                  request_id='market')
+        batch.execute()
+    except Exception as e:
+        print(f"An error occurred during the batched folder lookup: {e}")
+        return None
+
+    if 'zone' not in responses or 'market' not in responses:
+        return None
+    zone_items = responses['zone'].get('files', [])
+    market = responses['market']
+    market_candidates = None if market.get('nextPageToken') else market.get('files', [])
+    return {'zone': zone_items[0]['id'] if zone_items else None, 'market_candidates': market_candidates}
+
+
+def resolve_market_folder(service, market_name, zone_name, parent_folder_id):
+    """Finds or creates the Zone/Market folder pair and returns the market folder ID."""
+    if zone_name:
+        # Once the zone folder is cached there is only the market left to look up
+        cached_zone_folder_id = _get_cached_folder_id(zone_name, parent_folder_id)
+        if cached_zone_folder_id:
+            return find_or_create_folder(service, market_name, cached_zone_folder_id)
+
+    found = None
+    if zone_name and getattr(settings, 'DRIVE_BATCH_FOLDER_LOOKUP', False):
+        found = batch_find_zone_and_market_folders(service, zone_name, market_name, parent_folder_id)
+
+    target_parent_for_market = parent_folder_id
+    if zone_name:
+        if found is None:
+            zone_folder_id = find_or_create_folder(service, zone_name, parent_folder_id)
+        elif found['zone']:
+            zone_folder_id = _cache_folder_id(zone_name, parent_folder_id, found['zone'])
+            print(f"Found existing folder '{zone_name}' with ID: {zone_folder_id}")
+        else:
+            print(f"Folder '{zone_name}' not found, creating it...")
+            zone_folder_id = create_drive_folder(service, zone_name, parent_folder_id)
+        if zone_folder_id:
+            target_parent_for_market = zone_folder_id
+        else:
+            print(
+                f"Failed to find or create Zone folder '{zone_name}'. Market folder will be created directly under the main parent.")
+
+    if found is None or found['market_candidates'] is None:
+        # Not listed completely: look for the market under the resolved zone only
+        return find_or_create_folder(service, market_name, target_parent_for_market)
+    for candidate in found['market_candidates']:
+        if target_parent_for_market in candidate.get('parents', []):
+            print(f"Found existing folder '{market_name}' with ID: {candidate['id']}")
+            return _cache_folder_id(market_name, target_parent_for_market, candidate['id'])
+    print(f"Folder '{market_name}' not found, creating it...")
+    return create_drive_folder(service, market_name, target_parent_for_market)
+
+
+def _create_drive_file(service, ppt_file, parent_folder_id, file_name=None):
+    file_name = file_name or os.path.basename(ppt_file)
+    file_metadata = {
+        'name': file_name,
+        'parents': [parent_folder_id]
+    }
+    if isinstance(ppt_file, str):
+        resumable = os.path.getsize(ppt_file) > RESUMABLE_UPLOAD_THRESHOLD
+        media = MediaFileUpload(ppt_file, resumable=resumable, chunksize=UPLOAD_CHUNK_SIZE)
+    else:
+        # In-memory upload: send it straight from the buffer instead of writing it to disk first
+        file_size = ppt_file.seek(0, os.SEEK_END)
+        ppt_file.seek(0)
+        media = MediaIoBaseUpload(ppt_file, mimetype=PPTX_MIME_TYPE, chunksize=UPLOAD_CHUNK_SIZE,
+                                  resumable=file_size > RESUMABLE_UPLOAD_THRESHOLD)
+    file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
+    print(f"File '{file_name}' uploaded with ID: {file.get('id')}")
+    return file.get('id')
+
+
+def upload_file_to_drive(service, ppt_file, parent_folder_id, file_name=None):
     try:
-        file_name = os.path.basename(file_path)
-        file_metadata = {
-            'name': file_name,
-            'parents': [parent_folder_id]
-        }
-        media = MediaFileUpload(file_path, resumable=True)
-        file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-        print(f"File '{file_name}' uploaded with ID: {file.get('id')}")
-        return file.get('id')
+        return _create_drive_file(service, ppt_file, parent_folder_id, file_name)
     except HttpError as error:
         print(f"An HTTP error occurred during upload: {error}")
         return None
@@ -174,33 +267,102 @@ def upload_file_to_drive(service, file_path, parent_folder_id):
         return None
 
 
-def main_processor(ppt_file_path, parent_folder_id):
+def _is_rate_limited(error):
+    if error.resp.status in RETRYABLE_STATUS_CODES:
+        return True
+    # Drive reports per-user rate limits as 403 userRateLimitExceeded / rateLimitExceeded
+    return error.resp.status == 403 and b'ateLimitExceeded' in (error.content or b'')
+
+
+def upload_file_with_backoff(service, file_path, parent_folder_id):
+    """
+    Same as upload_file_to_drive, but retries rate-limited (429/403) and 5xx responses
+    with exponential backoff, honouring Retry-After when Drive sends one.
+    """
+    for attempt in range(UPLOAD_MAX_RETRIES + 1):
+        try:
+            return _create_drive_file(service, file_path, parent_folder_id)
+        except HttpError as error:
+            if not _is_rate_limited(error) or attempt == UPLOAD_MAX_RETRIES:
+                print(f"An HTTP error occurred during upload: {error}")
+                return None
+            retry_after = error.resp.get('retry-after')
+            if retry_after and retry_after.isdigit():
+                delay = int(retry_after)
+            else:
+                delay = min(2 ** attempt + random.random(), MAX_BACKOFF_SECONDS)
+            print(f"Upload of '{os.path.basename(file_path)}' was rate limited ({error.resp.status}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+        except Exception as e:
+            print(f"An unexpected error occurred during upload: {e}")
+            return None
+
+
+def upload_many(ppt_file_paths, parent_folder_id, max_workers=None):
+    """
+    Bulk version of main_processor. The Zone/Market folders are resolved one file at a
+    time so that two PPTs for the same market don't both create its folder, then the
+    files are uploaded concurrently, each worker thread using its own Drive service.
+    Returns one main_processor-style result dict per path, in the same order.
+    """
+    if max_workers is None:
+        max_workers = getattr(settings, 'DRIVE_UPLOAD_MAX_WORKERS', 2)
+    drive_service = authenticate_google_drive()
+    if not drive_service:
+        return [{'error': 'Authentication failed. Cannot proceed.'} for _ in ppt_file_paths]
+
+    results = [None] * len(ppt_file_paths)
+    uploads = []
+    market_folder_ids = {}
+    for index, ppt_file_path in enumerate(ppt_file_paths):
+        market_name, zone_name = get_market_and_zone_name_from_ppt(ppt_file_path)
+        if not market_name:
+            results[index] = {'error': 'Could not extract market name. Folder not created and PPT not uploaded.'}
+            continue
+        if (zone_name, market_name) not in market_folder_ids:
+            market_folder_ids[(zone_name, market_name)] = resolve_market_folder(
+                drive_service, market_name, zone_name, parent_folder_id)
+        market_folder_id = market_folder_ids[(zone_name, market_name)]
+        if not market_folder_id:
+            results[index] = {'error': f"Failed to create Market folder '{market_name}'. PPT file not uploaded."}
+            continue
+        uploads.append((index, ppt_file_path, market_folder_id))
+
+    def upload(item):
+        index, ppt_file_path, market_folder_id = item
+        return index, upload_file_with_backoff(authenticate_google_drive(), ppt_file_path, market_folder_id)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for index, uploaded_file_id in executor.map(upload, uploads):
+            if uploaded_file_id:
+                results[index] = {'message': 'File uploaded and organized successfully!', 'file_id': uploaded_file_id}
+            else:
+                results[index] = {'error': 'Failed to upload PPT file to the drive.'}
+    return results
+
+
+def main_processor(ppt_file, parent_folder_id, file_name=None):
+    """
+    ppt_file is a path or a seekable file object; file_name is the name to use on
+    Drive and defaults to the path's basename.
+    """
     print("Starting PPT processing and folder creation using OAuth 2.0...")
     drive_service = authenticate_google_drive()
     if not drive_service:
         return {'error': 'Authentication failed. Cannot proceed.'}
 
-    market_name, zone_name = get_market_and_zone_name_from_ppt(ppt_file_path)
+    market_name, zone_name = get_market_and_zone_name_from_ppt(ppt_file)
     if not market_name:
         return {'error': 'Could not extract market name. Folder not created and PPT not uploaded.'}
 
     print(f"Extracted Market Name: {market_name}")
     print(f"Extracted Zone Name: {zone_name}")
 
-    target_parent_for_market = parent_folder_id
-    if zone_name:
-        zone_folder_id = find_or_create_folder(drive_service, zone_name, parent_folder_id)
-        if zone_folder_id:
-            target_parent_for_market = zone_folder_id
-        else:
-            print(
-                f"Failed to find or create Zone folder '{zone_name}'. Market folder will be created directly under the main parent.")
-
-    market_folder_id = find_or_create_folder(drive_service, market_name, target_parent_for_market)
+    market_folder_id = resolve_market_folder(drive_service, market_name, zone_name, parent_folder_id)
     if not market_folder_id:
         return {'error': f"Failed to create Market folder '{market_name}'. PPT file not uploaded."}
 
-    uploaded_file_id = upload_file_to_drive(drive_service, ppt_file_path, market_folder_id)
+    uploaded_file_id = upload_file_to_drive(drive_service, ppt_file, market_folder_id, file_name)
     if uploaded_file_id:
         print("PPT file uploaded and placed in the correct folder.")
         return {'message': 'File uploaded and organized successfully!', 'file_id': uploaded_file_id}
@@ -216,7 +378,7 @@ def upload_page(request):
     """
     return render(request, 'uploader/index.html')
 
- ₹
+
 @csrf_exempt
 @require_POST
 def process_upload(request):
@@ -230,21 +392,14 @@ def process_upload(request):
         if not uploaded_file or not parent_folder_id:
             return JsonResponse({'error': 'Missing file or parent folder ID.'}, status=400)
 
-        # Create a temporary directory to store the uploaded file
-        temp_dir = tempfile.mkdtemp()
-        temp_file_path = os.path.join(temp_dir, uploaded_file.name)
-
-        # Write the uploaded file content to the new path
-        with open(temp_file_path, 'wb+') as f:
-            for chunk in uploaded_file.chunks():
-                f.write(chunk)
-
-        # Run the main processor logic with the new file path
-        result = main_processor(temp_file_path, parent_folder_id)
-
-        # Clean up the temporary file and directory
-        os.remove(temp_file_path)
-        os.rmdir(temp_dir)
+        # Large uploads are already spooled to a temp file and small ones are in memory;
+        # either way the file is read and uploaded from where Django put it.
+        # Django removes its temp file once the request is finished.
+        if hasattr(uploaded_file, 'temporary_file_path'):
+            ppt_file = uploaded_file.temporary_file_path()
+        else:
+            ppt_file = uploaded_file.file
+        result = main_processor(ppt_file, parent_folder_id, file_name=uploaded_file.name)
 
         if 'error' in result:
             return JsonResponse(result, status=500)
@@ -0,0 +1,127 @@
+"""Running ffmpeg for the WEBM to MP4 conversions, shared by the views and the Celery task."""
+import os
+import subprocess
+import tempfile
+from functools import lru_cache
+
+# Only the end of ffmpeg's log is returned in error messages
+FFMPEG_LOG_TAIL_SIZE = 8 * 1024
+
+# H.264 encoders in order of preference, with the rate-control flags for each.
+# The first one this ffmpeg build can actually use is picked by get_video_encoder().
+VIDEO_ENCODER_ARGS = {
+    'h264_nvenc': ['-preset', 'p1', '-tune', 'll', '-rc', 'vbr', '-cq', '23', '-b:v', '0'],  # NVIDIA GPUs
+    'h264_qsv': ['-preset', 'veryfast', '-global_quality', '23'],  # Intel Quick Sync
+    'h264_videotoolbox': ['-b:v', '5000k'],  # macOS/Apple Silicon
+    'libx264': ['-preset', 'veryfast', '-crf', '23', '-threads', '0'],  # Software fallback
+}
+AUDIO_ENCODE_ARGS = ['-c:a', 'aac', '-b:a', '128k']
+# A fragmented MP4 needs no seek back to the header, so it can be written to a pipe
+FFMPEG_STREAM_ARGS = ['-movflags', '+frag_keyframe+empty_moov+default_base_moof', '-f', 'mp4', 'pipe:1']
+
+
+# =================================================================================
+# === CORE CONVERSION LOGIC (Helper Function) ===
+# =================================================================================
+
+def _encoder_works(encoder):
+    """Encodes one blank frame, since an encoder can be compiled in without the hardware to run it."""
+    command = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-f', 'lavfi', '-i', 'color=size=256x256',
+        '-frames:v', '1', '-c:v', encoder, '-f', 'null', '-'
+    ]
+    try:
+        return subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+@lru_cache(maxsize=None)
+def get_video_encoder():
+    """
+    Picks the fastest H.264 encoder available on this machine, probing ffmpeg once per
+    process. Falls back to libx264 if ffmpeg can't be queried.
+    """
+    try:
+        listing = subprocess.run(
+            ['ffmpeg', '-hide_banner', '-encoders'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, timeout=30
+        ).stdout
+    except (OSError, subprocess.TimeoutExpired):
+        return 'libx264'
+    available = {line.split()[1] for line in listing.splitlines() if len(line.split()) > 1}
+    for encoder in VIDEO_ENCODER_ARGS:
+        if encoder in available and (encoder == 'libx264' or _encoder_works(encoder)):
+            print(f"Using ffmpeg video encoder: {encoder}")
+            return encoder
+    return 'libx264'
+
+
+def build_ffmpeg_command(input_path, output_args):
+    encoder = get_video_encoder()
+    return (
+        ['ffmpeg', '-hwaccel', 'auto', '-i', input_path, '-c:v', encoder]
+        + VIDEO_ENCODER_ARGS[encoder] + AUDIO_ENCODE_ARGS + output_args
+    )
+
+
+def read_log_tail(log_file):
+    log_size = log_file.seek(0, os.SEEK_END)
+    log_file.seek(max(0, log_size - FFMPEG_LOG_TAIL_SIZE))
+    return log_file.read().decode('utf-8', 'replace')
+
+
+def convert_video_file_fast(input_path, output_path):
+    """
+    Converts a video from WEBM to MP4 using ffmpeg with the fastest available H.264
+    encoder (NVENC, Quick Sync or VideoToolbox, falling back to libx264).
+
+    Returns: A dictionary with 'status' and 'message'.
+    """
+
+    command = build_ffmpeg_command(input_path, [
+        '-movflags', '+faststart',  # Put the index first so the file can play while downloading
+        '-y',  # Overwrite output files without asking
+        output_path
+    ])
+
+    # ffmpeg's progress output on a long encode can run to megabytes, so send it to
+    # an anonymous temp file instead of a pipe and only read back its tail on failure.
+    with tempfile.TemporaryFile() as ffmpeg_log:
+        try:
+            # Execute the command. check=True raises CalledProcessError on non-zero exit code.
+            subprocess.run(
+                command,
+                check=True,
+                stdout=subprocess.DEVNULL,
+                stderr=ffmpeg_log
+            )
+            return {'status': 'success', 'message': f'Conversion successful.'}
+
+        except subprocess.CalledProcessError:
+            error_output = read_log_tail(ffmpeg_log)
+            return {'status': 'error', 'message': f"FFmpeg Error: {error_output}"}
+        except FileNotFoundError:
+            return {'status': 'error', 'message': "FFmpeg not found. Ensure it is installed and in your system's PATH."}
+        except Exception as e:
+            return {'status': 'error', 'message': f"An unexpected error occurred: {str(e)}"}
+
+
+def start_streaming_conversion(input_path, stderr_file):
+    """
+    Starts ffmpeg converting input_path to a fragmented MP4 written to stdout, so the
+    encoded bytes can be sent to the client while the encode is still running.
+
+    Returns: The running subprocess.Popen object.
+    """
+    command = build_ffmpeg_command(input_path, FFMPEG_STREAM_ARGS)
+    return subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=stderr_file)
+
+
+def read_ffmpeg_log(temp_dir):
+    try:
+        with open(os.path.join(temp_dir, 'ffmpeg.log'), 'rb') as ffmpeg_log:
+            return read_log_tail(ffmpeg_log)
+    except OSError:
+        return ''
@@ -0,0 +1,153 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# Scratch directories from make_scratch_dir and files staged with staging_dir go to
+# tmpfs when the machine has one with room for them, so they never hit the disk.
+# Everything else (including Django's upload spooling, see FILE_UPLOAD_TEMP_DIR and
+# the pooled directories of acquire_scratch_dir) stays on disk.
+RAM_SCRATCH_DIR = '/dev/shm/nso_vault'
+DISK_SCRATCH_DIR = tempfile.gettempdir()
+# Leave this much of the tmpfs free for everything else that lives in RAM
+RAM_HEADROOM_BYTES = 512 * 1024 * 1024
+# Emptied scratch directories kept per process for the next acquire_scratch_dir()
+SCRATCH_POOL_SIZE = 4
+_SCRATCH_POOL = queue.Queue(maxsize=SCRATCH_POOL_SIZE)
+# tmpfs space promised to files this process is still writing with staging_dir; the
+# free space reported by the filesystem doesn't include them until they are written.
+_RAM_RESERVED_BYTES = 0
+_RAM_RESERVED_LOCK = threading.Lock()
+# This process's tmpfs directory for staged files, created on first use
+_ram_staging_dir = None
+
+
+def make_scratch_dir(required_bytes=0):
+    """
+    tempfile.mkdtemp() that falls back to the disk temp directory when the tmpfs
+    doesn't have room for required_bytes.
+    """
+    return tempfile.mkdtemp(dir=_scratch_root(required_bytes))
+
+
+def _ram_has_room(required_bytes):
+    """Whether the tmpfs has room for required_bytes plus headroom, after this process's reservations."""
+    try:
+        # Machines without /dev/shm raise here too
+        free_bytes = shutil.disk_usage(os.path.dirname(RAM_SCRATCH_DIR)).free
+    except OSError:
+        return False
+    return free_bytes - _RAM_RESERVED_BYTES >= required_bytes + RAM_HEADROOM_BYTES
+
+
+def _scratch_root(required_bytes):
+    """RAM_SCRATCH_DIR if the tmpfs has room for required_bytes plus headroom, else DISK_SCRATCH_DIR."""
+    if not _ram_has_room(required_bytes):
+        return DISK_SCRATCH_DIR
+    try:
+        os.makedirs(RAM_SCRATCH_DIR, exist_ok=True)
+    except OSError:
+        return DISK_SCRATCH_DIR
+    return RAM_SCRATCH_DIR
+
+
+def _get_ram_staging_dir():
+    global _ram_staging_dir
+    if _ram_staging_dir is None or not os.path.isdir(_ram_staging_dir):
+        os.makedirs(RAM_SCRATCH_DIR, exist_ok=True)
+        _ram_staging_dir = tempfile.mkdtemp(dir=RAM_SCRATCH_DIR)
+    return _ram_staging_dir
+
+
+@contextmanager
+def staging_dir(disk_dir, required_bytes):
+    """
+    Yields the directory a file of required_bytes should be written to: this process's
+    tmpfs directory when the tmpfs has room for it, otherwise disk_dir. The tmpfs space
+    stays reserved until the block exits, so files staged at the same time can't
+    together overfill it; the caller deletes its file before then. Files of unknown
+    size (required_bytes of 0 or None) always go to disk_dir.
+    """
+    global _RAM_RESERVED_BYTES
+    with _RAM_RESERVED_LOCK:
+        in_ram = bool(required_bytes) and _ram_has_room(required_bytes)
+        if in_ram:
+            _RAM_RESERVED_BYTES += required_bytes
+            try:
+                directory = _get_ram_staging_dir()
+            except OSError:
+                _RAM_RESERVED_BYTES -= required_bytes
+                in_ram = False
+    if not in_ram:
+        yield disk_dir
+        return
+    try:
+        yield directory
+    finally:
+        with _RAM_RESERVED_LOCK:
+            _RAM_RESERVED_BYTES -= required_bytes
+
+
+def discard_scratch_dir(path):
+    """
+    Removes a scratch directory without waiting for it: it is renamed out of the way
+    (so the name is free immediately) and deleted on a daemon thread, since unlinking
+    multi-GB leftovers on a disk filesystem can take seconds.
+    """
+    trash_path = f"{path}.trash"
+    try:
+        os.rename(path, trash_path)
+    except FileNotFoundError:
+        return
+    except OSError:
+        trash_path = path  # e.g. a stale .trash directory in the way; delete in place
+    threading.Thread(target=shutil.rmtree, args=(trash_path,), kwargs={'ignore_errors': True},
+                     daemon=True).start()
+
+
+def acquire_scratch_dir():
+    """
+    Returns a scratch directory on disk, handing out one released earlier by this
+    process when one is pooled instead of creating a new one.
+    """
+    while True:
+        try:
+            path = _SCRATCH_POOL.get_nowait()
+        except queue.Empty:
+            return tempfile.mkdtemp(dir=DISK_SCRATCH_DIR)
+        if os.path.isdir(path):
+            return path
+        discard_scratch_dir(path)
+
+
+def release_scratch_dir(path):
+    """
+    Returns a directory from acquire_scratch_dir() to the pool if it is empty; one
+    with leftovers in it (or one the full pool has no room for) is discarded instead.
+    """
+    try:
+        with os.scandir(path) as entries:
+            is_empty = next(entries, None) is None
+    except FileNotFoundError:
+        return
+    if is_empty:
+        try:
+            _SCRATCH_POOL.put_nowait(path)
+            return
+        except queue.Full:
+            pass
+    discard_scratch_dir(path)
+
+
+def clear_scratch_pool():
+    """Removes every pooled directory and this process's tmpfs staging directory; for process shutdown."""
+    if _ram_staging_dir:
+        shutil.rmtree(_ram_staging_dir, ignore_errors=True)
+    while True:
+        try:
+            path = _SCRATCH_POOL.get_nowait()
+        except queue.Empty:
+            return
+        shutil.rmtree(path, ignore_errors=True)
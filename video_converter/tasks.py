@@ -0,0 +1,38 @@
+# video_converter/tasks.py
+
+import os
+import shutil
+from celery import shared_task
+from django.conf import settings
+from .conversion import convert_video_file_fast
+
+
+@shared_task
+def convert_video_task(job_dir, input_file_name, output_file_name):
+    """
+    Celery task that converts an uploaded WEBM to MP4 inside job_dir. The upload is
+    removed once it has been converted, and the MP4 is removed after
+    VIDEO_CONVERSION_RETENTION_SECONDS whether or not it was downloaded.
+    """
+    input_file_path = os.path.join(job_dir, input_file_name)
+    output_file_path = os.path.join(job_dir, output_file_name)
+    try:
+        result = convert_video_file_fast(input_file_path, output_file_path)
+    finally:
+        if os.path.exists(input_file_path):
+            os.remove(input_file_path)
+
+    if result['status'] != 'success':
+        shutil.rmtree(job_dir, ignore_errors=True)
+        return result
+
+    cleanup_conversion_job.apply_async(
+        args=[job_dir], countdown=getattr(settings, 'VIDEO_CONVERSION_RETENTION_SECONDS', 3600))
+    result['output_path'] = output_file_path
+    result['output_file_name'] = output_file_name
+    return result
+
+
+@shared_task
+def cleanup_conversion_job(job_dir):
+    shutil.rmtree(job_dir, ignore_errors=True)
@@ -4,4 +4,7 @@ from . import views
 urlpatterns = [
     path('', views.webm_to_mp4_page, name='webm_to_mp4_page'),
     path('process/', views.process_webm_to_mp4, name='process_webm_to_mp4'),
+    path('jobs/', views.start_webm_to_mp4, name='start_webm_to_mp4'),
+    path('jobs/<str:task_id>/', views.conversion_status, name='conversion_status'),
+    path('jobs/<str:task_id>/download/', views.download_converted_mp4, name='download_converted_mp4'),
 ]
\ No newline at end of file
@@ -1,53 +1,65 @@
 import os
+import shutil
 import tempfile
-import subprocess
+from urllib.parse import quote
 from django.shortcuts import render
-from django.http import JsonResponse, FileResponse
+from django.urls import reverse
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.utils.http import content_disposition_header
 from django.views.decorators.http import require_POST
+from .conversion import read_ffmpeg_log, start_streaming_conversion
+from .scratch import discard_scratch_dir, make_scratch_dir
 
+# Buffer size for copying in-memory uploads to disk
+COPY_BUFFER_SIZE = 1024 * 1024
+# Size of the reads from ffmpeg's stdout that are passed on to the client
+STREAM_CHUNK_SIZE = 1024 * 1024
 
-# =================================================================================
-# === CORE CONVERSION LOGIC (Helper Function) ===
-# =================================================================================
 
-def convert_video_file_fast(input_path, output_path):
-    """
-    Converts a video from WEBM to MP4 using ffmpeg with h264_videotoolbox 
-    for fast, hardware-accelerated encoding (ideal for macOS/Apple Silicon).
-
-    Returns: A dictionary with 'status' and 'message'.
-    """
+def cleanup_temp_dir(temp_dir):
+    # Deleted in the background so large unlinks don't hold up the response
+    if temp_dir:
+        discard_scratch_dir(temp_dir)
 
-    # Your specified fast command arguments
-    command = [
-        'ffmpeg',
-        '-i', input_path,
-        '-c:v', 'h264_videotoolbox',  # Hardware video encoder (macOS specific)
-        '-b:v', '5000k',
-        '-c:a', 'aac',
-        '-b:a', '128k',
-        '-y',  # Overwrite output files without asking
-        output_path
-    ]
 
-    try:
-        # Execute the command. check=True raises CalledProcessError on non-zero exit code.
-        subprocess.run(
-            command,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        return {'status': 'success', 'message': f'Conversion successful.'}
+class ConversionOutputStream:
+    """
+    Iterates over ffmpeg's stdout in chunks. Django calls close() when the response is
+    closed, whether the stream finished or the client went away, so ffmpeg and the
+    temp files are always cleaned up.
+    """
 
-    except subprocess.CalledProcessError as e:
-        error_output = e.stderr.decode()
-        return {'status': 'error', 'message': f"FFmpeg Error: {error_output}"}
-    except FileNotFoundError:
-        return {'status': 'error', 'message': "FFmpeg not found. Ensure it is installed and in your system's PATH."}
-    except Exception as e:
-        return {'status': 'error', 'message': f"An unexpected error occurred: {str(e)}"}
+    def __init__(self, process, first_chunk, temp_dir):
+        self.process = process
+        self.first_chunk = first_chunk
+        self.temp_dir = temp_dir
+        self.closed = False
+
+    def __iter__(self):
+        yield self.first_chunk
+        yield from iter(lambda: self.process.stdout.read1(STREAM_CHUNK_SIZE), b'')
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.process.stdout.close()
+        if self.process.poll() is None:
+            self.process.kill()
+        if self.process.wait() != 0:
+            print(f"FFmpeg exited with code {self.process.returncode} while streaming: {read_ffmpeg_log(self.temp_dir)}")
+        cleanup_temp_dir(self.temp_dir)
+
+
+def save_uploaded_file(uploaded_file, file_path):
+    # Django already spooled large uploads to a temp file, so those are moved instead of copied
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        shutil.move(uploaded_file.temporary_file_path(), file_path)
+    else:
+        with open(file_path, 'wb') as f:
+            shutil.copyfileobj(uploaded_file, f, length=COPY_BUFFER_SIZE)
 
 
 # =================================================================================
@@ -75,65 +87,129 @@ def process_webm_to_mp4(request):
         return JsonResponse({'status': 'error', 'message': 'Missing or invalid WEBM file uploaded.'}, status=400)
 
     temp_dir = None
-    input_file_path = None
-    output_file_path = None
+    streaming = False
 
     try:
         # 1. Prepare file paths
-        temp_dir = tempfile.mkdtemp()
+        temp_dir = make_scratch_dir(uploaded_file.size)
         input_file_path = os.path.join(temp_dir, uploaded_file.name)
 
         base_name, _ = os.path.splitext(uploaded_file.name)
         output_file_name = f"{base_name}.mp4"
-        output_file_path = os.path.join(temp_dir, output_file_name)
 
         # 2. Save uploaded file to disk
-        with open(input_file_path, 'wb+') as f:
-            for chunk in uploaded_file.chunks():
-                f.write(chunk)
+        save_uploaded_file(uploaded_file, input_file_path)
+
+        # 3. Start the conversion, writing the MP4 to ffmpeg's stdout
+        try:
+            with open(os.path.join(temp_dir, 'ffmpeg.log'), 'wb') as ffmpeg_log:
+                process = start_streaming_conversion(input_file_path, ffmpeg_log)
+        except FileNotFoundError:
+            return JsonResponse(
+                {'status': 'error', 'message': "FFmpeg not found. Ensure it is installed and in your system's PATH."},
+                status=500)
+
+        # ffmpeg produces no output at all when it cannot read the input, so the
+        # failure can still be reported as JSON before any bytes are sent.
+        first_chunk = process.stdout.read1(STREAM_CHUNK_SIZE)
+        if not first_chunk:
+            process.stdout.close()
+            process.wait()
+            return JsonResponse({'status': 'error', 'message': f"FFmpeg Error: {read_ffmpeg_log(temp_dir)}"},
+                                status=500)
+
+        # 4. Stream the converted file to the user while ffmpeg keeps encoding;
+        # the stream removes the temp directory once the response is closed.
+        response = StreamingHttpResponse(
+            ConversionOutputStream(process, first_chunk, temp_dir),
+            content_type='video/mp4'
+        )
+        response['Content-Disposition'] = content_disposition_header(True, output_file_name)
+        streaming = True
+        return response
 
-        # 3. Perform the conversion
-        result = convert_video_file_fast(input_file_path, output_file_path)
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': f'Server Error during processing: {str(e)}'}, status=500)
 
-        if result['status'] == 'success' and os.path.exists(output_file_path):
+    finally:
+        # 5. Clean up temporary files, unless the streaming response has taken them over
+        if not streaming:
+            cleanup_temp_dir(temp_dir)
 
-            # 4. Return the converted file directly to the user
-            # FileResponse streams the file contents, and the 'finally' block 
-            # ensures cleanup happens AFTER the response is sent.
-            response = FileResponse(
-                open(output_file_path, 'rb'),
-                content_type='video/mp4'
-            )
-            response['Content-Disposition'] = f'attachment; filename="{output_file_name}"'
+# To fully use this view, you must:
+# 1. Create a template at `video_converter/templates/video_converter/index.html` with a file upload form.
+# 2. Map the URLs in your app's `urls.py`.
 
-            # Attach cleanup function to the response object to run later
-            response.cleanup_paths = [temp_dir]
 
-            return response
-        else:
-            # Conversion failed
-            return JsonResponse(result, status=500)
+@csrf_exempt
+@require_POST
+def start_webm_to_mp4(request):
+    """
+    Queues the conversion on a Celery worker instead of running ffmpeg in the request.
+    Returns 202 with a task ID; poll conversion_status and fetch the result from
+    download_converted_mp4.
+    """
+    from .tasks import convert_video_task
+
+    uploaded_file = request.FILES.get('webm_file')
 
+    if not uploaded_file or not uploaded_file.name.lower().endswith('.webm'):
+        return JsonResponse({'status': 'error', 'message': 'Missing or invalid WEBM file uploaded.'}, status=400)
+
+    # The worker reads the upload from here, so this must be storage it can see
+    jobs_dir = getattr(settings, 'VIDEO_CONVERSION_JOBS_DIR', None) or tempfile.gettempdir()
+    try:
+        os.makedirs(jobs_dir, exist_ok=True)
+        job_dir = tempfile.mkdtemp(dir=jobs_dir)
+        save_uploaded_file(uploaded_file, os.path.join(job_dir, uploaded_file.name))
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': f'Server Error during processing: {str(e)}'}, status=500)
 
-    finally:
-        # 5. Clean up temporary files
-        # NOTE: For FileResponse, the cleanup happens after the file is streamed.
-        # This block is here as a fallback and for successful conversions handled 
-        # by Django's framework (which often calls a cleanup hook if set on the response).
-        def cleanup_temp_dir():
-            if temp_dir and os.path.exists(temp_dir):
-                try:
-                    import shutil
-                    shutil.rmtree(temp_dir)
-                except Exception as e:
-                    print(f"Cleanup failed for directory {temp_dir}: {e}")
-
-        # If the request failed before FileResponse was created, clean up immediately.
-        if 'response' not in locals() and temp_dir:
-            cleanup_temp_dir()
+    base_name, _ = os.path.splitext(uploaded_file.name)
+    task = convert_video_task.delay(job_dir, uploaded_file.name, f"{base_name}.mp4")
+    return JsonResponse({
+        'status': 'success',
+        'message': 'Conversion started.',
+        'task_id': task.id
+    }, status=202)
 
-# To fully use this view, you must:
-# 1. Create a template at `video_converter/templates/video_converter/index.html` with a file upload form.
-# 2. Map the URLs in your app's `urls.py`.
\ No newline at end of file
+
+def conversion_status(request, task_id):
+    """
+    Reports the state of a queued conversion: PENDING/STARTED while it runs, then
+    SUCCESS with a download URL or FAILURE with ffmpeg's error.
+    """
+    from celery.result import AsyncResult
+
+    task = AsyncResult(task_id)
+    if not task.ready():
+        return JsonResponse({'status': task.state})
+    result = task.result if task.successful() else {'status': 'error', 'message': str(task.result)}
+    if result.get('status') != 'success':
+        return JsonResponse({'status': 'FAILURE', 'message': result.get('message')})
+    return JsonResponse({'status': 'SUCCESS', 'download_url': reverse('download_converted_mp4', args=[task_id])})
+
+
+def download_converted_mp4(request, task_id):
+    """
+    Serves a finished conversion. When VIDEO_CONVERSION_ACCEL_REDIRECT_PREFIX is set,
+    the file is handed to nginx with X-Accel-Redirect so Django never reads it.
+    """
+    from celery.result import AsyncResult
+
+    task = AsyncResult(task_id)
+    result = task.result if task.successful() else None
+    if not result or result.get('status') != 'success' or not os.path.exists(result['output_path']):
+        raise Http404("Converted file not found.")
+
+    accel_prefix = getattr(settings, 'VIDEO_CONVERSION_ACCEL_REDIRECT_PREFIX', None)
+    if accel_prefix:
+        jobs_dir = getattr(settings, 'VIDEO_CONVERSION_JOBS_DIR', None) or tempfile.gettempdir()
+        response = HttpResponse(content_type='video/mp4')
+        # Header values must be ASCII, and nginx decodes the URI before looking the file up
+        relative_path = os.path.relpath(result['output_path'], jobs_dir).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(relative_path)
+        response['Content-Disposition'] = content_disposition_header(True, result['output_file_name'])
+        return response
+    return FileResponse(open(result['output_path'], 'rb'), as_attachment=True,
+                        filename=result['output_file_name'], content_type='video/mp4')
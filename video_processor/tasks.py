@@ -1,17 +1,112 @@
 # video_processor/tasks.py
 
+import logging
+import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
 from celery import shared_task
+from celery.signals import worker_process_init, worker_process_shutdown
+from django.conf import settings
+from django.core.cache import cache
+from uploader.google_credentials import DRIVE_CREDENTIALS, get_discovery_doc
+from video_converter.scratch import acquire_scratch_dir, clear_scratch_pool, release_scratch_dir
 # Import the main processing function from the new services.py file
-from .services import process_video_links_internal
+from .services import API_SERVICE_NAME, API_VERSION, DriveHelper, process_video_links_internal, pptx_version
 
-@shared_task
-def process_video_task(google_drive_folder_id):
+# A folder is processed by one task at a time; the lock expires on its own if a worker dies mid-run
+RUNNING_LOCK_SECONDS = 2 * 60 * 60
+
+logger = logging.getLogger(__name__)
+_log_listener = None
+
+
+@worker_process_init.connect
+def log_through_queue(**kwargs):
+    """
+    Hands this app's log records to a background thread that writes them out through
+    the worker's handlers, so the video threads never block on log I/O.
+    """
+    global _log_listener
+    root_handlers = logging.getLogger().handlers
+    if not root_handlers:
+        return
+    log_queue = queue.SimpleQueue()
+    _log_listener = QueueListener(log_queue, *root_handlers, respect_handler_level=True)
+    _log_listener.start()
+    app_logger = logging.getLogger('video_processor')
+    app_logger.addHandler(QueueHandler(log_queue))
+    app_logger.propagate = False
+
+
+@worker_process_shutdown.connect
+def flush_log_queue(**kwargs):
+    if _log_listener:
+        _log_listener.stop()
+
+
+@worker_process_shutdown.connect
+def remove_scratch_dirs(**kwargs):
+    clear_scratch_pool()
+
+
+def _warm_up_drive():
+    try:
+        get_discovery_doc(API_SERVICE_NAME, API_VERSION)
+        DRIVE_CREDENTIALS.get_credentials()
+    except Exception as e:
+        logger.warning("Could not preload the Drive credentials: %s", e)
+
+
+@worker_process_init.connect
+def preload_drive_service(**kwargs):
+    """
+    Parses the Drive discovery document and loads (and if need be refreshes) the Drive
+    credentials before the first task arrives, so that task starts as fast as the ones
+    after it. This runs on a background thread: the token refresh is a network call,
+    and Celery kills a child that takes longer than worker_proc_alive_timeout to start.
+    A task arriving first simply waits on the credentials lock.
+    """
+    # Without a saved token the browser flow would run here; leave that to a task
+    if not os.path.exists(DRIVE_CREDENTIALS.token_path):
+        return
+    threading.Thread(target=_warm_up_drive, name='drive-warm-up', daemon=True).start()
+
+
+@shared_task(bind=True)
+def process_video_task(self, google_drive_folder_id):
     """
     Celery task to handle video processing.
+    Repeat submissions for a folder are skipped while it is being processed, and
+    afterwards as long as its PPTX is unchanged (see VIDEO_PROCESSOR_RESULT_CACHE_SECONDS).
     """
+    running_key = f"video_processor:running:{google_drive_folder_id}"
+    if not cache.add(running_key, self.request.id, timeout=RUNNING_LOCK_SECONDS):
+        return {"status": "skipped", "message": "This folder is already being processed."}
+    temp_download_dir = None
     try:
-        temp_download_dir = 'temp_drive_downloads'
-        process_video_links_internal(google_drive_folder_id, temp_download_dir)
+        done_key = f"video_processor:done:{google_drive_folder_id}"
+        pptx_file = version = None
+        drive_helper = DriveHelper()
+        service = drive_helper.get_authenticated_drive_service()
+        if service:
+            # Also handed to process_video_links_internal, so the folder is only listed once
+            pptx_file = drive_helper.find_pptx_in_drive_folder(service, google_drive_folder_id)
+            version = pptx_version(pptx_file) if pptx_file else None
+            if version and cache.get(done_key) == version:
+                return {"status": "skipped", "message": "This PPTX has already been processed."}
+
+        # A directory of this worker process's own, so concurrent workers never share or delete
+        # each other's downloads; reused by its next task. A Drive video whose size fits in
+        # the free tmpfs space is staged there instead (see staging_dir).
+        temp_download_dir = acquire_scratch_dir()
+        # Only a run where every link was uploaded or already present is remembered
+        if process_video_links_internal(google_drive_folder_id, temp_download_dir, pptx_file) and version:
+            cache.set(done_key, version, getattr(settings, 'VIDEO_PROCESSOR_RESULT_CACHE_SECONDS', 0))
         return {"status": "success", "message": "Video processing completed."}
     except Exception as e:
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        return {"status": "error", "message": str(e)}
+    finally:
+        if temp_download_dir:
+            release_scratch_dir(temp_download_dir)
+        cache.delete(running_key)
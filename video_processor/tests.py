@@ -1,3 +1,157 @@
-from django.test import TestCase
+import re
+import threading
+import time
+from contextlib import ExitStack
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from video_processor.services import (
+    ZONE_PATTERN, AdaptiveDownloadPool, DriveRateLimiter, _find_market_line, _find_zone_name,
+)
+
+ZONE_SLIDE_TEXTS = [
+    "ZONE : North West\nSTATE : Punjab\nCITY : Ludhiana\n",
+    "zone: south  city: chennai\n",
+    "Zone :\n  East Zone\n\nPIN CODE 700001\n",
+    "ZONE : Central\n",
+    "ZONE : Central",
+    "ZONE : Real Estate Belt\nCITY : Pune\n",
+    "Zone list\nZONE :   West [Image 1]\nSTATE : Goa\n",
+    "ZONES : none\nZONE : Last\n",
+    "No zone heading here\n",
+    "ZONE : İstanbul\nCITY : İzmir\n",
+    "İ\nZONE : Anatolia\n",
+    "ZONE : Coast ſtate : Kerala\n",
+]
+
+MARKET_SLIDE_TEXTS = [
+    ("North\nNorth 1_Ludhiana_LDH\n", "North"),
+    ("north 2_a_b\nNORTH 3_c_d\n", "North"),
+    ("North 1_no_second\nNorth 1_two_here\n", "North"),
+    ("North 1_onlyone\n", "North"),
+    ("North\n1_a_b\n", "North"),
+    ("  North 1_a_b\n", "North"),
+    ("North x_a_b\n", "North"),
+    ("North  4_a_b", "North"),
+    ("İstanbul 1_Kadıköy_IST\n", "İstanbul"),
+    ("ISTANBUL 1_a_b\nİstanbul 2_c_d\n", "İstanbul"),
+    ("Paſs 1_a_b\n", "Pass"),
+]
+
+
+def _regex_market_line(slide_text, zone_name):
+    market_match = re.search(r"^" + re.escape(zone_name) + r"\s*\d_.*?_.*$", slide_text,
+                             re.IGNORECASE | re.MULTILINE)
+    return market_match.group(0) if market_match else None
+
+
+class SlideTextSearchTests(SimpleTestCase):
+    def test_find_zone_name_matches_zone_pattern(self):
+        for slide_text in ZONE_SLIDE_TEXTS:
+            with self.subTest(slide_text=slide_text):
+                zone_match = ZONE_PATTERN.search(slide_text)
+                zone_name = _find_zone_name(slide_text)
+                if zone_match is None:
+                    self.assertIsNone(zone_name)
+                else:
+                    self.assertEqual(zone_name.strip(), zone_match.group(1).strip())
+
+    def test_find_zone_name_falls_back_to_zone_pattern_for_non_ascii_text(self):
+        slide_text = "ZONE : İstanbul\nCITY : İzmir\n"
+        self.assertFalse(slide_text.isascii())
+        self.assertEqual(_find_zone_name(slide_text).strip(), "İstanbul")
+
+    def test_find_market_line_matches_case_variants_only_re_folds(self):
+        self.assertEqual(_find_market_line("ISTANBUL 1_a_b\n", "İstanbul"), "ISTANBUL 1_a_b")
+
+    def test_find_market_line_matches_market_regex(self):
+        for slide_text, zone_name in MARKET_SLIDE_TEXTS:
+            with self.subTest(slide_text=slide_text):
+                market_line = _find_market_line(slide_text, zone_name)
+                expected = _regex_market_line(slide_text, zone_name)
+                self.assertEqual(market_line.strip() if market_line is not None else None,
+                                 expected.strip() if expected is not None else None)
+
+
+class DriveRateLimiterTests(SimpleTestCase):
+    def test_acquire_admits_a_burst_then_paces_calls(self):
+        limiter = DriveRateLimiter(rate=10)
+        start = time.monotonic()
+        for _ in range(10):
+            limiter.acquire()
+        self.assertLess(time.monotonic() - start, 0.05)
+
+        start = time.monotonic()
+        limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+    def test_acquire_lets_a_batch_larger_than_the_bucket_through(self):
+        limiter = DriveRateLimiter(rate=4)
+        start = time.monotonic()
+        limiter.acquire(cost=10)
+        self.assertLess(time.monotonic() - start, 0.05)
+
+    def test_throttle_halves_the_rate_down_to_the_minimum(self):
+        limiter = DriveRateLimiter(rate=8, minimum=1.0)
+        limiter.throttle()
+        self.assertEqual(limiter.rate, 4)
+        for _ in range(5):
+            limiter.throttle()
+        self.assertEqual(limiter.rate, 1.0)
+
+    def test_rate_recovers_by_one_per_interval_up_to_the_maximum(self):
+        limiter = DriveRateLimiter(rate=8, interval=10.0)
+        limiter.throttle()
+        limiter._last_change -= limiter.interval
+        limiter.acquire()
+        self.assertEqual(limiter.rate, 5)
+
+        limiter.rate = limiter.maximum
+        limiter._last_change -= limiter.interval
+        limiter.acquire()
+        self.assertEqual(limiter.rate, limiter.maximum)
+
+
+class AdaptiveDownloadPoolTests(SimpleTestCase):
+    def test_slot_blocks_until_one_is_released(self):
+        pool = AdaptiveDownloadPool(initial=2)
+        entered = threading.Event()
+
+        def take_slot():
+            with pool.slot():
+                entered.set()
+
+        with ExitStack() as slots:
+            slots.enter_context(pool.slot())
+            second = slots.enter_context(ExitStack())
+            second.enter_context(pool.slot())
+            waiter = threading.Thread(target=take_slot)
+            waiter.start()
+            self.assertFalse(entered.wait(0.1))
+            second.close()
+            self.assertTrue(entered.wait(1))
+        waiter.join()
+
+    def test_limit_grows_while_throughput_improves_and_the_pool_is_full(self):
+        pool = AdaptiveDownloadPool(initial=2, maximum=3)
+        with pool.slot(), pool.slot():
+            with pool._condition:
+                pool._adjust(100)
+                self.assertEqual(pool.limit, 3)
+                pool._adjust(200)
+                self.assertEqual(pool.limit, 3)
+
+    def test_limit_stays_put_while_the_pool_is_not_full(self):
+        pool = AdaptiveDownloadPool(initial=2)
+        with pool._condition:
+            pool._adjust(100)
+        self.assertEqual(pool.limit, 2)
+
+    def test_limit_halves_when_throughput_drops(self):
+        pool = AdaptiveDownloadPool(initial=8, minimum=3)
+        with pool._condition:
+            pool._adjust(100)
+            pool._adjust(10)
+            self.assertEqual(pool.limit, 4)
+            pool._adjust(1)
+            self.assertEqual(pool.limit, 3)